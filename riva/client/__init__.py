@@ -6,8 +6,12 @@ from riva.client.asr import (
     AsyncAudioChunkFileIterator,
     ASRService,
     add_audio_file_specs_to_config,
+    async_sleep_audio_length,
     add_word_boosting_to_config,
     add_speaker_diarization_to_config,
+    chunk_frames_for_tier,
+    coalesce_audio_chunks,
+    get_streaming_request_size,
     get_wav_file_parameters,
     print_offline,
     print_streaming,
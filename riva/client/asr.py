@@ -1,18 +1,23 @@
 # SPDX-FileCopyrightText: Copyright (c) 2022 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
 # SPDX-License-Identifier: MIT
 
+import asyncio
+import inspect
 import io
+import mmap
 import os
 import sys
 import time
 import warnings
 import wave
 from pathlib import Path
-from typing import AsyncGenerator, AsyncIterable, AsyncIterator, Callable, Dict, List, Optional, TextIO, Union
+from typing import (
+    AsyncGenerator, AsyncIterable, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Iterable, List, Optional, TextIO,
+    Union,
+)
 
 from grpc._channel import _MultiThreadedRendezvous
 
-import riva.client
 import riva.client.proto.riva_asr_pb2 as rasr
 import riva.client.proto.riva_asr_pb2_grpc as rasr_srv
 from riva.client.auth import Auth
@@ -38,22 +43,88 @@ def get_wav_file_parameters(input_file: Union[str, os.PathLike]) -> Dict[str, Un
     return parameters
 
 
+# Bytes added around raw audio when a chunk is sent: a one byte protobuf field tag and a length varint, a 5 byte
+# gRPC message prefix and a 9 byte HTTP/2 DATA frame header.
+STREAMING_REQUEST_FIXED_OVERHEAD = 1 + 5 + 9
+# Default target for a marshaled ``StreamingRecognizeRequest`` with audio content. Keeping a request just under an
+# allocator size class avoids having every send rounded up to the next, much larger, buffer size.
+DEFAULT_STREAMING_REQUEST_TIER = 4096
+
+
+def _varint_size(value: int) -> int:
+    size = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+
+def get_streaming_request_size(chunk_n_bytes: int) -> int:
+    """Returns a number of bytes an audio chunk of :param:`chunk_n_bytes` bytes occupies on the wire."""
+    return chunk_n_bytes + _varint_size(chunk_n_bytes) + STREAMING_REQUEST_FIXED_OVERHEAD
+
+
+def chunk_frames_for_tier(
+    sampwidth: int = 2,
+    nchannels: int = 1,
+    target_tier: int = DEFAULT_STREAMING_REQUEST_TIER,
+) -> int:
+    """
+    Computes the largest number of frames in an audio chunk for which a marshaled streaming request still fits into
+    :param:`target_tier` bytes. The result is intentionally not a round number: it is what is left of the tier after
+    protobuf, gRPC and HTTP/2 framing.
+
+    Args:
+        sampwidth (:obj:`int`, defaults to :obj:`2`): a number of bytes in one sample.
+        nchannels (:obj:`int`, defaults to :obj:`1`): a number of audio channels.
+        target_tier (:obj:`int`, defaults to :obj:`4096`): a maximum size of a request on the wire in bytes.
+
+    Returns:
+        :obj:`int`: a number of frames in one chunk.
+    """
+    frame_n_bytes = sampwidth * nchannels
+    n_frames = (target_tier - STREAMING_REQUEST_FIXED_OVERHEAD - _varint_size(target_tier)) // frame_n_bytes
+    if n_frames < 1:
+        raise ValueError(f"Target tier {target_tier} is too small for a frame of {frame_n_bytes} bytes.")
+    return n_frames
+
+
+# A default of `file_parameters` of chunk iterators, distinct from `None` which means "not a WAV file".
+_NOT_PARSED = object()
+
+
 def sleep_audio_length(audio_chunk: bytes, time_to_sleep: float) -> None:
     time.sleep(time_to_sleep)
 
 
+async def async_sleep_audio_length(audio_chunk: bytes, time_to_sleep: float) -> None:
+    await asyncio.sleep(time_to_sleep)
+
+
 class AudioChunkFileIterator:
     def __init__(
         self,
         input_file: Union[str, os.PathLike],
         chunk_n_frames: int,
         delay_callback: Optional[Callable[[bytes, float], None]] = None,
+        file_parameters: Optional[Dict[str, Union[int, float]]] = _NOT_PARSED,
     ) -> None:
         self.input_file: Path = Path(input_file).expanduser()
         self.chunk_n_frames = chunk_n_frames
         self.delay_callback = delay_callback
-        self.file_parameters = get_wav_file_parameters(self.input_file)
-        self.file_object: Optional[typing.BinaryIO] = open(str(self.input_file), 'rb')
+        # Callers which already parsed the WAV header may pass its parameters, including `None` for a file which is
+        # not a WAV file, to avoid parsing it again.
+        self.file_parameters = (
+            get_wav_file_parameters(self.input_file) if file_parameters is _NOT_PARSED else file_parameters
+        )
+        self.file_object: Optional[BinaryIO] = open(str(self.input_file), 'rb')
+        if self.file_parameters:
+            # Computed once so that a chunk duration costs a single division in the streaming loop.
+            self.n_bytes_per_second = (
+                self.file_parameters['sampwidth'] * self.file_parameters['nchannels'] * self.file_parameters['framerate']
+            )
+        else:
+            self.n_bytes_per_second = None
         if self.delay_callback and self.file_parameters is None:
             warnings.warn(f"delay_callback not supported for encoding other than LINEAR_PCM")
             self.delay_callback = None
@@ -83,9 +154,7 @@ class AudioChunkFileIterator:
             raise StopIteration
         if self.delay_callback is not None:
             offset = self.file_parameters['data_offset'] if self.first_buffer else 0
-            self.delay_callback(
-                data[offset:], (len(data) - offset) / self.file_parameters['sampwidth'] / self.file_parameters['framerate']
-            )
+            self.delay_callback(data[offset:], (len(data) - offset) / self.n_bytes_per_second)
             self.first_buffer = False
         return data
 
@@ -95,28 +164,61 @@ class AsyncAudioChunkFileIterator:
         self,
         input_file: Union[str, os.PathLike],
         chunk_n_frames: int,
-        delay_callback: Optional[Callable[[bytes, float], None]] = None,
+        delay_callback: Optional[Callable[[bytes, float], Optional[Awaitable[None]]]] = None,
+        file_parameters: Optional[Dict[str, Union[int, float]]] = _NOT_PARSED,
     ) -> None:
         self.input_file: Path = Path(input_file).expanduser()
         self.chunk_n_frames = chunk_n_frames
         self.delay_callback = delay_callback
-        self.file_parameters = get_wav_file_parameters(self.input_file)
-        self.file_object: Optional[typing.BinaryIO] = None
+        # Callers which already parsed the WAV header may pass its parameters, including `None` for a file which is
+        # not a WAV file, to avoid parsing it again.
+        self.file_parameters = (
+            get_wav_file_parameters(self.input_file) if file_parameters is _NOT_PARSED else file_parameters
+        )
+        self.file_object: Optional[BinaryIO] = None
+        # Chunks are sliced directly from a read-only memory map of the file, so streaming does not issue a
+        # ``read()`` call and an intermediate buffer copy per chunk.
+        self.file_map: Optional[mmap.mmap] = None
+        self.position = 0
+        if self.file_parameters:
+            frame_n_bytes = self.file_parameters['sampwidth'] * self.file_parameters['nchannels']
+            self.chunk_n_bytes = chunk_n_frames * frame_n_bytes
+            # Computed once so that a chunk duration costs a single division in the streaming loop.
+            self.n_bytes_per_second = frame_n_bytes * self.file_parameters['framerate']
+        else:
+            self.chunk_n_bytes = chunk_n_frames
+            self.n_bytes_per_second = None
         if self.delay_callback and self.file_parameters is None:
             warnings.warn("delay_callback not supported for encoding other than LINEAR_PCM")
             self.delay_callback = None
         self.first_buffer = True
+        # The file is opened right away, so a missing or unreadable file raises ``OSError`` here.
+        self._open()
 
-    async def __aenter__(self):
+    def _open(self) -> None:
         self.file_object = open(str(self.input_file), 'rb')
+        try:
+            # An empty file cannot be memory mapped. It simply yields no chunks.
+            if os.fstat(self.file_object.fileno()).st_size > 0:
+                self.file_map = mmap.mmap(self.file_object.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self.file_object.close()
+            self.file_object = None
+            raise
+        self.position = 0
+
+    async def __aenter__(self):
+        if self.file_object is None:
+            self._open()
         return self
 
     async def __aexit__(self, type_, value, traceback) -> None:
-        if self.file_object is not None:
-            self.file_object.close()
-            self.file_object = None
+        await self.close()
 
     async def close(self) -> None:
+        if self.file_map is not None:
+            self.file_map.close()
+            self.file_map = None
         if self.file_object is not None:
             self.file_object.close()
             self.file_object = None
@@ -126,12 +228,13 @@ class AsyncAudioChunkFileIterator:
 
     async def __anext__(self) -> bytes:
         if self.file_object is None:
-            self.file_object = open(str(self.input_file), 'rb')
-            
-        if self.file_parameters:
-            data = self.file_object.read(self.chunk_n_frames * self.file_parameters['sampwidth'] * self.file_parameters['nchannels'])
+            self._open()
+
+        if self.file_map is not None:
+            data = self.file_map[self.position : self.position + self.chunk_n_bytes]
         else:
-            data = self.file_object.read(self.chunk_n_frames)
+            data = b''
+        self.position += len(data)
 
         if not data:
             await self.close()
@@ -139,15 +242,64 @@ class AsyncAudioChunkFileIterator:
 
         if self.delay_callback is not None:
             offset = self.file_parameters['data_offset'] if self.first_buffer else 0
-            self.delay_callback(
-                data[offset:], 
-                (len(data) - offset) / self.file_parameters['sampwidth'] / self.file_parameters['framerate']
-            )
+            delay = self.delay_callback(data[offset:], (len(data) - offset) / self.n_bytes_per_second)
+            if inspect.isawaitable(delay):
+                await delay
             self.first_buffer = False
 
         return data
 
 
+async def _iterate_in_executor(audio_chunks: Iterable[bytes]) -> AsyncGenerator[bytes, None]:
+    # Blocking iterators, e.g. :class:`riva.client.audio_io.MicrophoneStream`, are advanced in a worker thread so
+    # that waiting for audio does not stall the event loop.
+    loop = asyncio.get_running_loop()
+    iterator = iter(audio_chunks)
+    while True:
+        chunk = await loop.run_in_executor(None, next, iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+async def coalesce_audio_chunks(
+    audio_chunks: Union[Iterable[bytes], AsyncIterable[bytes]], factor: int = 1
+) -> AsyncGenerator[bytes, None]:
+    """
+    Merges every :param:`factor` successive audio chunks into one chunk so that fewer streaming requests are sent.
+    Each merged chunk delays transcription by ``factor - 1`` chunks of audio.
+
+    Args:
+        audio_chunks (:obj:`Union[Iterable[bytes], AsyncIterable[bytes]]`): raw audio fragments, e.g.
+            :class:`riva.client.AsyncAudioChunkFileIterator` or :class:`riva.client.audio_io.MicrophoneStream`.
+        factor (:obj:`int`, defaults to :obj:`1`): a number of chunks merged into one. If :obj:`1`, then chunks are
+            passed through unchanged.
+
+    Yields:
+        :obj:`bytes`: merged audio chunks. The last chunk may contain less than :param:`factor` source chunks.
+
+    Raises:
+        :obj:`ValueError`: if :param:`factor` is less than 1.
+    """
+    if factor < 1:
+        raise ValueError(f"Coalescing factor has to be greater than or equal to 1, whereas {factor} was provided.")
+    if not isinstance(audio_chunks, AsyncIterable):
+        audio_chunks = _iterate_in_executor(audio_chunks)
+    if factor == 1:
+        async for chunk in audio_chunks:
+            yield chunk
+        return
+    # Chunks are joined once per merged chunk, so each source chunk is copied a single time.
+    parts = []
+    async for chunk in audio_chunks:
+        parts.append(chunk)
+        if len(parts) == factor:
+            yield b''.join(parts)
+            parts = []
+    if parts:
+        yield b''.join(parts)
+
+
 def add_word_boosting_to_config(
     config: Union[rasr.StreamingRecognitionConfig, rasr.RecognitionConfig],
     boosted_lm_words: Optional[List[str]],
@@ -232,6 +384,7 @@ def add_custom_configuration_to_config(
 
 
 PRINT_STREAMING_ADDITIONAL_INFO_MODES = ['no', 'time', 'confidence']
+PRINT_STREAMING_TIMESTAMPS_HEADER = "Timestamps:\n" + '{: <40s}{: <16s}{: <16s}\n'.format('Word', 'Start (ms)', 'End (ms)')
 
 
 async def print_streaming(
@@ -298,80 +451,88 @@ async def print_streaming(
                 file_opened[i] = False
             else:
                 file_opened[i] = True
-                output_file[i] = Path(elem).expanduser().open(file_mode)
+                output_file[i] = Path(elem).expanduser().open(file_mode, encoding='utf-8')
         start_time = time.time()  # used in 'time` additional_info
         num_chars_printed = 0  # used in 'no' additional_info
         async for response in responses:
-            if not response.results:
+            results = response.results
+            if not results:
                 continue
             partial_transcript = ""
-            for result in response.results:
-                if result.pipeline_states and len(result.pipeline_states.vad_probabilities) > 0:
-                    vad_prob_logs = "VAD States: "
-                    for vad_state in result.pipeline_states.vad_probabilities:
-                            vad_prob_logs += str(vad_state) + " "
-                    for i, f in enumerate(output_file):
-                        f.write(vad_prob_logs + "\n")
-                if not result.alternatives:
+            # Output of a response is gathered per destination and written with one call, so that a stream lock is
+            # acquired once per response instead of once per line.
+            pending = [[] for _ in output_file]
+            for result in results:
+                pipeline_states = result.pipeline_states
+                if pipeline_states and len(pipeline_states.vad_probabilities) > 0:
+                    vad_prob_logs = "VAD States: " + "".join(
+                        str(vad_state) + " " for vad_state in pipeline_states.vad_probabilities
+                    )
+                    for parts in pending:
+                        parts.append(vad_prob_logs + "\n")
+                alternatives = result.alternatives
+                if not alternatives:
                     continue
-                transcript = result.alternatives[0].transcript
+                # Fields are bound to locals once per result as each protobuf attribute access builds a new wrapper.
+                best_alternative = alternatives[0]
+                transcript = best_alternative.transcript
+                is_final = result.is_final
                 if additional_info == 'no':
-                    if result.is_final:
+                    if is_final:
                         if show_intermediate:
                             overwrite_chars = ' ' * (num_chars_printed - len(transcript))
-                            for i, f in enumerate(output_file):
-                                f.write("## " + transcript + (overwrite_chars if not file_opened[i] else '') + "\n")
+                            for i, parts in enumerate(pending):
+                                parts.append("## " + transcript + (overwrite_chars if not file_opened[i] else '') + "\n")
                             num_chars_printed = 0
                         else:
-                            for i, alternative in enumerate(result.alternatives):
-                                for f in output_file:
-                                    f.write(
-                                        f'##'
-                                        + (f'(alternative {i + 1})' if i > 0 else '')
-                                        + f' {alternative.transcript}\n'
-                                    )
+                            for i, alternative in enumerate(alternatives):
+                                line = f'##' + (f'(alternative {i + 1})' if i > 0 else '') + f' {alternative.transcript}\n'
+                                for parts in pending:
+                                    parts.append(line)
                     else:
                         partial_transcript += transcript
                 elif additional_info == 'time':
-                    if result.is_final:
-                        for i, alternative in enumerate(result.alternatives):
-                            for f in output_file:
-                                f.write(
-                                    f"Time {time.time() - start_time:.2f}s: Transcript {i}: {alternative.transcript}\n"
-                                )
+                    if is_final:
+                        for i, alternative in enumerate(alternatives):
+                            line = f"Time {time.time() - start_time:.2f}s: Transcript {i}: {alternative.transcript}\n"
+                            for parts in pending:
+                                parts.append(line)
                         if word_time_offsets:
-                            for f in output_file:
-                                f.write("Timestamps:\n")
-                                f.write('{: <40s}{: <16s}{: <16s}\n'.format('Word', 'Start (ms)', 'End (ms)'))
-                                for word_info in result.alternatives[0].words:
-                                    f.write(
-                                        f'{word_info.word: <40s}{word_info.start_time: <16.0f}'
-                                        f'{word_info.end_time: <16.0f}\n'
-                                    )
+                            lines = [PRINT_STREAMING_TIMESTAMPS_HEADER] + [
+                                f'{word_info.word: <40s}{word_info.start_time: <16.0f}{word_info.end_time: <16.0f}\n'
+                                for word_info in best_alternative.words
+                            ]
+                            for parts in pending:
+                                parts.extend(lines)
                     else:
                         partial_transcript += transcript
                 else:  # additional_info == 'confidence'
-                    if result.is_final:
-                        for f in output_file:
-                            f.write(f'## {transcript}\n')
-                            f.write(f'Confidence: {result.alternatives[0].confidence:9.4f}\n')
+                    if is_final:
+                        line = f'## {transcript}\nConfidence: {best_alternative.confidence:9.4f}\n'
                     else:
-                        for f in output_file:
-                            f.write(f'>> {transcript}\n')
-                            f.write(f'Stability: {result.stability:9.4f}\n')
+                        line = f'>> {transcript}\nStability: {result.stability:9.4f}\n'
+                    for parts in pending:
+                        parts.append(line)
             if additional_info == 'no':
                 if show_intermediate and partial_transcript != '':
                     overwrite_chars = ' ' * (num_chars_printed - len(partial_transcript))
-                    for i, f in enumerate(output_file):
-                        f.write(">> " + partial_transcript + ('\n' if file_opened[i] else overwrite_chars + '\r'))
+                    for i, parts in enumerate(pending):
+                        parts.append(">> " + partial_transcript + ('\n' if file_opened[i] else overwrite_chars + '\r'))
                     num_chars_printed = len(partial_transcript) + 3
             elif additional_info == 'time':
-                for f in output_file:
-                    if partial_transcript:
-                        f.write(f">>>Time {time.time():.2f}s: {partial_transcript}\n")
+                if partial_transcript:
+                    line = f">>>Time {time.time():.2f}s: {partial_transcript}\n"
+                    for parts in pending:
+                        parts.append(line)
             else:
-                for f in output_file:
-                    f.write('----\n')
+                for parts in pending:
+                    parts.append('----\n')
+            for f, parts, opened in zip(output_file, pending, file_opened):
+                if parts:
+                    f.write("".join(parts))
+                    # Streams provided by a caller, e.g. a console, show each response as soon as it is received.
+                    if not opened:
+                        f.flush()
     finally:
         for fo, elem in zip(file_opened, output_file):
             if fo:
@@ -388,11 +549,22 @@ def print_offline(response: rasr.RecognizeResponse) -> None:
 
 
 async def streaming_request_generator(
-    audio_chunks: AsyncIterable[bytes], streaming_config: rasr.StreamingRecognitionConfig
+    audio_chunks: AsyncIterable[bytes],
+    streaming_config: Union[rasr.StreamingRecognitionConfig, rasr.StreamingRecognizeRequest],
 ) -> AsyncGenerator[rasr.StreamingRecognizeRequest, None]:
-    yield rasr.StreamingRecognizeRequest(streaming_config=streaming_config)
+    # A prebuilt config request is sent as is, so callers which open many streams with one config, e.g. on retries,
+    # do not have to rebuild the first request of every stream.
+    if isinstance(streaming_config, rasr.StreamingRecognizeRequest):
+        yield streaming_config
+    else:
+        yield rasr.StreamingRecognizeRequest(streaming_config=streaming_config)
+    # One request message is reused for all audio chunks. gRPC serializes each request before asking for the next
+    # one, so overwriting ``audio_content`` does not affect requests which were already sent. Assigning
+    # ``audio_content`` also replaces the previous value of the ``streaming_request`` oneof, so no ``Clear()`` is needed.
+    request = rasr.StreamingRecognizeRequest()
     async for chunk in audio_chunks:
-        yield rasr.StreamingRecognizeRequest(audio_content=chunk)
+        request.audio_content = chunk
+        yield request
 
 
 class ASRService:
@@ -409,7 +581,9 @@ class ASRService:
         self.stub = rasr_srv.RivaSpeechRecognitionStub(self.auth.channel)
 
     async def streaming_response_generator(
-        self, audio_chunks: AsyncIterable[bytes], streaming_config: rasr.StreamingRecognitionConfig
+        self,
+        audio_chunks: AsyncIterable[bytes],
+        streaming_config: Union[rasr.StreamingRecognitionConfig, rasr.StreamingRecognizeRequest],
     ) -> AsyncGenerator[rasr.StreamingRecognizeResponse, None]:
         """
         Generates speech recognition responses for fragments of speech audio in :param:`audio_chunks`.
@@ -440,6 +614,9 @@ class ASRService:
                     config = RecognitionConfig(enable_automatic_punctuation=True)
                     streaming_config = StreamingRecognitionConfig(config, interim_results=True)
 
+                A ``StreamingRecognizeRequest`` which contains a config may be passed instead. It is sent as the first
+                request without being rebuilt, which is convenient if many streams are opened with the same config.
+
         Yields:
             :obj:`riva.client.proto.riva_asr_pb2.StreamingRecognizeResponse`: responses for audio chunks in
             :param:`audio_chunks`. You may find description of response fields in declaration of
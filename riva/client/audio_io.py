@@ -7,6 +7,12 @@ from typing import Dict, Union, Optional
 import pyaudio
 
 
+# Format of audio recorded by :class:`MicrophoneStream`: 16-bit mono.
+MICROPHONE_FORMAT = pyaudio.paInt16
+MICROPHONE_SAMPWIDTH = pyaudio.get_sample_size(MICROPHONE_FORMAT)
+MICROPHONE_NCHANNELS = 1
+
+
 class MicrophoneStream:
     """Opens a recording stream as responses yielding the audio chunks."""
 
@@ -22,9 +28,9 @@ class MicrophoneStream:
     def __enter__(self):
         self._audio_interface = pyaudio.PyAudio()
         self._audio_stream = self._audio_interface.open(
-            format=pyaudio.paInt16,
+            format=MICROPHONE_FORMAT,
             input_device_index=self._device,
-            channels=1,
+            channels=MICROPHONE_NCHANNELS,
             rate=self._rate,
             input=True,
             frames_per_buffer=self._chunk,
@@ -58,16 +64,21 @@ class MicrophoneStream:
         chunk = self._buff.get()
         if chunk is None:
             raise StopIteration
+        # Usually a single chunk is buffered and it is returned without building a list.
+        if self._buff.empty():
+            return chunk
         data = [chunk]
 
         while True:
             try:
                 chunk = self._buff.get(block=False)
-                if chunk is None:
-                    assert not self.closed
-                data.append(chunk)
             except queue.Empty:
                 break
+            if chunk is None:
+                # The stream was closed while chunks were drained. The end of the stream is seen by the next call.
+                self._buff.put(None)
+                break
+            data.append(chunk)
 
         return b''.join(data)
 
@@ -1,12 +1,17 @@
 # SPDX-FileCopyrightText: Copyright (c) 2022 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
 # SPDX-License-Identifier: MIT
 
+import asyncio
 import os
 from pathlib import Path
 from typing import List, Optional, Tuple, Union
 import grpc
 
 
+# A default number of seconds scripts wait for a connection to a server in `Auth.wait_for_channel_ready()`.
+CHANNEL_READY_TIMEOUT = 5.0
+
+
 def create_channel(
     ssl_cert: Optional[Union[str, os.PathLike]] = None, use_ssl: bool = False, uri: str = "localhost:50051", metadata: Optional[List[Tuple[str, str]]] = None,
 ) -> grpc.aio.Channel:
@@ -87,6 +92,20 @@ class Auth:
         self._in_context = False
         self._channel = None
 
+    async def wait_for_channel_ready(self, timeout: Optional[float] = None) -> None:
+        """
+        Connects a channel to a server and waits until the connection is established. Calling this method before
+        the first request moves TCP, TLS and HTTP/2 handshakes off a latency critical path of the request.
+
+        Args:
+            timeout (:obj:`float`, `optional`): a maximum number of seconds to wait. If :obj:`None`, then waits
+                until the channel is ready.
+
+        Raises:
+            :obj:`asyncio.TimeoutError`: if the channel is not ready after :param:`timeout` seconds.
+        """
+        await asyncio.wait_for(self.channel.channel_ready(), timeout)
+
     def get_auth_metadata(self) -> List[Tuple[str, str]]:
         """
         Will become useful when API key and OAUTH tokens will be enabled.
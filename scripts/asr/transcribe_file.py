@@ -4,9 +4,11 @@
 import argparse
 
 import asyncio
-import os
-from typing import AsyncIterable
+import sys
+from collections import defaultdict
+
 import riva.client
+from riva.client.auth import CHANNEL_READY_TIMEOUT
 from riva.client.argparse_utils import add_asr_config_argparse_parameters, add_connection_argparse_parameters
 
 
@@ -42,8 +44,17 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--file-streaming-chunk",
         type=int,
-        default=1600,
-        help="A maximum number of frames in one chunk sent to server.",
+        default=None,
+        help="A maximum number of frames in one chunk sent to server. By default, it is computed from the WAV header "
+        "so that a chunk together with its protobuf, gRPC and HTTP/2 framing stays under 4 KiB, which is why it is "
+        "not a round number.",
+    )
+    parser.add_argument(
+        "--coalesce-factor",
+        type=int,
+        default=1,
+        help="A number of successive chunks merged into one request. Values greater than 1 reduce a number of "
+        "requests sent to server at the cost of latency.",
     )
     parser.add_argument(
         "--simulate-realtime",
@@ -54,38 +65,21 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--print-confidence", action="store_true", help="Whether to print stability and confidence of transcript."
     )
+    parser.add_argument(
+        "--warm-channel",
+        action="store_true",
+        help="Whether to establish a connection to server before streaming starts so that the first audio chunk "
+        "does not wait for connection handshakes.",
+    )
     parser = add_connection_argparse_parameters(parser)
     parser = add_asr_config_argparse_parameters(parser, max_alternatives=True, profanity_filter=True, word_time_offsets=True)
     args = parser.parse_args()
-    if args.play_audio or args.output_device is not None or args.list_devices:
-        import riva.client.audio_io
+    if args.coalesce_factor < 1:
+        parser.error("`--coalesce-factor` must be greater than or equal to 1")
     return args
 
-async def get_wav_bytes(file_path: str, chunk_size: int = 8192) -> AsyncIterable[bytes]:
-    """
-    Read a WAV file and yield its contents as bytes chunks asynchronously.
-    
-    Args:
-        file_path: Path to the WAV file
-        chunk_size: Size of each chunk in bytes (default: 8192)
-    
-    Yields:
-        Chunks of bytes from the WAV file
-    """
-    async with await asyncio.open(file_path, mode='rb') as file:
-        while chunk := await file.read(chunk_size):
-            yield chunk
-
-async def main() -> None:
-    args = parse_args()
-    if args.list_devices:
-        riva.client.audio_io.list_output_devices()
-        return
-
-    if not os.path.isfile(args.input_file):
-        print(f"Invalid input file path: {args.input_file}")
-        return
 
+def build_config(args: argparse.Namespace) -> riva.client.StreamingRecognitionConfig:
     config = riva.client.StreamingRecognitionConfig(
         config=riva.client.RecognitionConfig(
             language_code=args.language_code,
@@ -111,60 +105,108 @@ async def main() -> None:
         config,
         args.custom_configuration
     )
+    return config
+
+
+def create_auth(args: argparse.Namespace) -> riva.client.Auth:
+    return riva.client.Auth(args.ssl_cert, args.use_ssl, args.server, args.metadata)
+
+
+async def list_models(asr_service: riva.client.ASRService) -> None:
+    asr_models = defaultdict(lambda: {"models": []})
+    config_response = await asr_service.stub.GetRivaSpeechRecognitionConfig(
+        riva.client.proto.riva_asr_pb2.RivaSpeechRecognitionConfigRequest()
+    )
+    for model_config in config_response.model_config:
+        parameters = model_config.parameters
+        if parameters["streaming"] and parameters["type"]:
+            asr_models[parameters['language_code']]["models"].append(model_config.model_name)
+
+    print("Available ASR models")
+    # Sorted for a stable, readable listing of languages.
+    print(dict(sorted(asr_models.items())))
+
+
+async def main() -> None:
+    args = parse_args()
+    # Listing modes return before any streaming config is built.
+    if args.list_devices:
+        from riva.client import audio_io
+
+        audio_io.list_output_devices()
+        return
+
+    if args.list_models:
+        async with create_auth(args) as auth:
+            await list_models(riva.client.ASRService(auth))
+        return
+
+    config = build_config(args)
+    # The header is parsed once and shared by the sound callback and the chunk iterator.
+    wp = riva.client.get_wav_file_parameters(args.input_file)
+    chunk_n_frames = args.file_streaming_chunk
+    if chunk_n_frames is None:
+        chunk_n_frames = (
+            riva.client.chunk_frames_for_tier() if wp is None
+            else riva.client.chunk_frames_for_tier(wp['sampwidth'], wp['nchannels'])
+        )
+    try:
+        audio_chunk_iterator = riva.client.AsyncAudioChunkFileIterator(
+            args.input_file,
+            chunk_n_frames,
+            riva.client.async_sleep_audio_length if args.simulate_realtime else None,
+            file_parameters=wp,
+        )
+    except OSError:
+        print(f"Invalid input file path: {args.input_file}")
+        return
+
     sound_callback = None
     try:
         if args.play_audio or args.output_device is not None:
-            wp = riva.client.get_wav_file_parameters(args.input_file)
-            sound_callback = riva.client.audio_io.SoundCallBack(
+            from riva.client import audio_io
+
+            sound_callback = audio_io.SoundCallBack(
                 args.output_device, wp['sampwidth'], wp['nchannels'], wp['framerate'],
             )
-            delay_callback = sound_callback
-        else:
-            delay_callback = (
-                riva.client.sleep_audio_length if args.simulate_realtime else None
-            )
+            audio_chunk_iterator.delay_callback = sound_callback
 
-        async with riva.client.Auth(
-            args.ssl_cert,
-            args.use_ssl,
-            args.server,
-            args.metadata,
-        ) as auth:
+        async with create_auth(args) as auth:
+            if args.warm_channel:
+                try:
+                    await auth.wait_for_channel_ready(CHANNEL_READY_TIMEOUT)
+                except asyncio.TimeoutError:
+                    print(f"Could not connect to server {args.server} in {CHANNEL_READY_TIMEOUT} seconds")
+                    return
             asr_service = riva.client.ASRService(auth)
-
-            if args.list_models:
-                asr_models = dict()
-                config_response = asr_service.stub.GetRivaSpeechRecognitionConfig(riva.client.proto.riva_asr_pb2.RivaSpeechRecognitionConfigRequest())
-                for model_config in config_response.model_config:
-                    if model_config.parameters["streaming"] and model_config.parameters["type"]:
-                        language_code = model_config.parameters['language_code']
-                        if language_code in asr_models:
-                            asr_models[language_code]["models"].append(model_config.model_name)
-                        else:
-                            asr_models[language_code] = {"models": [model_config.model_name]}
-
-                print("Available ASR models")
-                asr_models = dict(sorted(asr_models.items()))
-                print(asr_models)
-                return
-            
-            async with riva.client.AsyncAudioChunkFileIterator(
-                args.input_file,
-                args.file_streaming_chunk,
-                delay_callback,
-            ) as audio_chunk_iterator:
+            async with audio_chunk_iterator:
+                request_size = riva.client.get_streaming_request_size(
+                    audio_chunk_iterator.chunk_n_bytes * args.coalesce_factor
+                )
+                print(
+                    f"Streaming chunks of {chunk_n_frames} frames, projected marshaled request size is "
+                    f"{request_size} bytes",
+                    file=sys.stderr,
+                )
                 await riva.client.print_streaming(
                     responses=asr_service.streaming_response_generator(
-                        audio_chunks=audio_chunk_iterator,
+                        audio_chunks=riva.client.coalesce_audio_chunks(audio_chunk_iterator, args.coalesce_factor),
                         streaming_config=config,
                     ),
                     show_intermediate=args.show_intermediate,
                     additional_info="confidence" if args.print_confidence else "no",
                 )
     finally:
+        await audio_chunk_iterator.close()
         if sound_callback is not None and sound_callback.opened:
             sound_callback.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        # `uvloop` is an optional faster event loop. It is installed with `pip install nvidia-riva-client[uvloop]`.
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
@@ -1,11 +1,15 @@
 # SPDX-FileCopyrightText: Copyright (c) 2022 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
 # SPDX-License-Identifier: MIT
 
+import asyncio
+import sys
+
 import riva.client
 import riva.client.audio_io
+from riva.client.auth import CHANNEL_READY_TIMEOUT
 from dataclasses import dataclass
 
-@dataclass
+@dataclass(frozen=True)
 class Args:
     input_device: int = 1
     list_devices: bool = False
@@ -29,14 +33,26 @@ class Args:
     ssl_cert: str = None
     use_ssl: bool = False
     metadata: dict = None
+    warm_channel: bool = False
     sample_rate_hz: int = 16000
-    file_streaming_chunk: int = 1600
+    # Not a round number: a microphone chunk plus request framing stays under 4 KiB.
+    file_streaming_chunk: int = riva.client.chunk_frames_for_tier(
+        riva.client.audio_io.MICROPHONE_SAMPWIDTH, riva.client.audio_io.MICROPHONE_NCHANNELS
+    )
+    coalesce_factor: int = 1
 
-def main() -> None:
+async def main() -> None:
     args = Args()
     print(args)
-    auth = riva.client.Auth(args.ssl_cert, args.use_ssl, args.server, args.metadata)
-    asr_service = riva.client.ASRService(auth)
+    frame_n_bytes = riva.client.audio_io.MICROPHONE_SAMPWIDTH * riva.client.audio_io.MICROPHONE_NCHANNELS
+    request_size = riva.client.get_streaming_request_size(
+        args.file_streaming_chunk * frame_n_bytes * args.coalesce_factor
+    )
+    print(
+        f"Streaming chunks of {args.file_streaming_chunk} frames, projected marshaled request size is "
+        f"{request_size} bytes",
+        file=sys.stderr,
+    )
     config = riva.client.StreamingRecognitionConfig(
         config=riva.client.RecognitionConfig(
             encoding=riva.client.AudioEncoding.LINEAR_PCM,
@@ -63,18 +79,26 @@ def main() -> None:
         args.stop_threshold,
         args.stop_threshold_eou,
     )
-    with riva.client.audio_io.MicrophoneStream(
-        args.sample_rate_hz,
-        args.file_streaming_chunk,
-        device=args.input_device,
-    ) as audio_chunk_iterator:
-        riva.client.print_streaming(
-            responses=asr_service.streaming_response_generator(
-                audio_chunks=audio_chunk_iterator,
-                streaming_config=config,
-            ),
-            show_intermediate=True,
-        )
+    async with riva.client.Auth(args.ssl_cert, args.use_ssl, args.server, args.metadata) as auth:
+        if args.warm_channel:
+            try:
+                await auth.wait_for_channel_ready(CHANNEL_READY_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"Could not connect to server {args.server} in {CHANNEL_READY_TIMEOUT} seconds")
+                return
+        asr_service = riva.client.ASRService(auth)
+        with riva.client.audio_io.MicrophoneStream(
+            args.sample_rate_hz,
+            args.file_streaming_chunk,
+            device=args.input_device,
+        ) as audio_chunk_iterator:
+            await riva.client.print_streaming(
+                responses=asr_service.streaming_response_generator(
+                    audio_chunks=riva.client.coalesce_audio_chunks(audio_chunk_iterator, args.coalesce_factor),
+                    streaming_config=config,
+                ),
+                show_intermediate=True,
+            )
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
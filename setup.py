@@ -149,5 +149,6 @@ setuptools.setup(
     ],
     python_requires='>=3.7',
     install_requires=install_requires,
+    extras_require={'uvloop': ['uvloop>=0.18; sys_platform != "win32" and python_version >= "3.8"']},
     setup_requires=['grpcio-tools'],
 )
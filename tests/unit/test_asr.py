@@ -1,13 +1,20 @@
 # SPDX-FileCopyrightText: Copyright (c) 2022 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
 # SPDX-License-Identifier: MIT
 
+import asyncio
+import io
+import wave
 from math import ceil
 from typing import Any, Generator, List, Union
 from unittest.mock import patch, Mock
 
+import pytest
+
 import riva.client.proto.riva_asr_pb2 as rasr
-from riva.client import ASRService
-from riva.client.asr import streaming_request_generator
+from riva.client import ASRService, AsyncAudioChunkFileIterator
+from riva.client.asr import (
+    chunk_frames_for_tier, coalesce_audio_chunks, get_streaming_request_size, print_streaming, streaming_request_generator
+)
 
 from .helpers import set_auth_mock
 
@@ -92,3 +99,120 @@ class TestSpeechSynthesisService:
         assert len(STREAMING_RECOGNIZE_MOCK.call_args.kwargs) == 1
         assert 'metadata' in STREAMING_RECOGNIZE_MOCK.call_args.kwargs
         assert STREAMING_RECOGNIZE_MOCK.call_args.kwargs['metadata'] == return_value_of_get_auth_metadata
+
+
+def write_wav_file(path, n_frames: int = SAMPLE_RATE_HZ, nchannels: int = 1) -> bytes:
+    with wave.open(str(path), 'wb') as wf:
+        wf.setnchannels(nchannels)
+        wf.setsampwidth(SAMPLE_WIDTH)
+        wf.setframerate(SAMPLE_RATE_HZ)
+        wf.writeframes(b'a' * SAMPLE_WIDTH * nchannels * n_frames)
+    return path.read_bytes()
+
+
+async def collect_chunks(iterator: AsyncAudioChunkFileIterator) -> List[bytes]:
+    async with iterator:
+        return [chunk async for chunk in iterator]
+
+
+class TestAsyncAudioChunkFileIterator:
+    def test_chunks_cover_whole_file(self, tmp_path) -> None:
+        file_bytes = write_wav_file(tmp_path / 'audio.wav')
+        iterator = AsyncAudioChunkFileIterator(tmp_path / 'audio.wav', STREAMING_CHUNK_SIZE)
+        chunks = asyncio.run(collect_chunks(iterator))
+        assert all(isinstance(chunk, bytes) for chunk in chunks)
+        assert all(len(chunk) == STREAMING_CHUNK_SIZE * SAMPLE_WIDTH for chunk in chunks[:-1])
+        assert b''.join(chunks) == file_bytes
+        assert iterator.file_object is None
+
+    def test_empty_file(self, tmp_path) -> None:
+        (tmp_path / 'empty.wav').write_bytes(b'')
+        iterator = AsyncAudioChunkFileIterator(tmp_path / 'empty.wav', STREAMING_CHUNK_SIZE)
+        assert asyncio.run(collect_chunks(iterator)) == []
+
+    def test_delay_callback_durations_sum_to_file_duration(self, tmp_path) -> None:
+        n_frames = SAMPLE_RATE_HZ // 2
+        write_wav_file(tmp_path / 'stereo.wav', n_frames=n_frames, nchannels=2)
+        durations = []
+        iterator = AsyncAudioChunkFileIterator(
+            tmp_path / 'stereo.wav', STREAMING_CHUNK_SIZE, lambda audio_chunk, duration: durations.append(duration)
+        )
+        asyncio.run(collect_chunks(iterator))
+        assert sum(durations) == pytest.approx(n_frames / SAMPLE_RATE_HZ)
+
+    def test_file_parameters_are_not_parsed_again(self, tmp_path) -> None:
+        (tmp_path / 'audio.raw').write_bytes(b'a' * STREAMING_CHUNK_SIZE)
+        with patch("riva.client.asr.get_wav_file_parameters") as get_wav_file_parameters_mock:
+            iterator = AsyncAudioChunkFileIterator(tmp_path / 'audio.raw', STREAMING_CHUNK_SIZE, file_parameters=None)
+        get_wav_file_parameters_mock.assert_not_called()
+        assert iterator.file_parameters is None
+        assert asyncio.run(collect_chunks(iterator)) == [b'a' * STREAMING_CHUNK_SIZE]
+
+    def test_missing_file_raises_on_construction(self, tmp_path) -> None:
+        with pytest.raises(FileNotFoundError):
+            AsyncAudioChunkFileIterator(tmp_path / 'missing.wav', STREAMING_CHUNK_SIZE)
+
+
+def test_chunk_frames_for_tier() -> None:
+    for sampwidth, nchannels, tier in [(2, 1, 4096), (2, 2, 4096), (4, 1, 16384)]:
+        n_frames = chunk_frames_for_tier(sampwidth, nchannels, tier)
+        assert get_streaming_request_size(n_frames * sampwidth * nchannels) <= tier
+        assert get_streaming_request_size((n_frames + 1) * sampwidth * nchannels) > tier
+
+
+async def collect_coalesced(audio_chunks, factor: int) -> List[bytes]:
+    return [chunk async for chunk in coalesce_audio_chunks(audio_chunks, factor)]
+
+
+def test_coalesce_audio_chunks() -> None:
+    for factor in [1, 2, 3, len(AUDIO_CHUNKS) + 1]:
+        chunks = asyncio.run(collect_coalesced(AUDIO_CHUNKS, factor))
+        assert len(chunks) == ceil(len(AUDIO_CHUNKS) / factor)
+        assert b''.join(chunks) == AUDIO_BYTES_1_SECOND
+
+
+async def async_iterate(items: List[Any]):
+    for item in items:
+        yield item
+
+
+def test_print_streaming_confidence() -> None:
+    responses = [
+        rasr.StreamingRecognizeResponse(
+            results=[
+                rasr.StreamingRecognitionResult(
+                    alternatives=[rasr.SpeechRecognitionAlternative(transcript="hello")], stability=0.5
+                )
+            ]
+        ),
+        rasr.StreamingRecognizeResponse(
+            results=[
+                rasr.StreamingRecognitionResult(
+                    alternatives=[rasr.SpeechRecognitionAlternative(transcript="hello world", confidence=0.9)],
+                    is_final=True,
+                )
+            ]
+        ),
+    ]
+    output = io.StringIO()
+    asyncio.run(print_streaming(async_iterate(responses), output_file=output, additional_info='confidence'))
+    assert output.getvalue() == (
+        ">> hello\nStability:    0.5000\n----\n## hello world\nConfidence:    0.9000\n----\n"
+    )
+
+
+async def collect_requests(streaming_config) -> List[rasr.StreamingRecognizeRequest]:
+    # Audio requests reuse one message, so each one is copied in the same way gRPC serializes it.
+    return [
+        rasr.StreamingRecognizeRequest.FromString(request.SerializeToString())
+        async for request in streaming_request_generator(async_iterate(AUDIO_CHUNKS), streaming_config)
+    ]
+
+
+def test_streaming_request_generator_accepts_config_request() -> None:
+    config_request = rasr.StreamingRecognizeRequest(streaming_config=STREAMING_RECOGNITION_CONFIG)
+    from_config = asyncio.run(collect_requests(STREAMING_RECOGNITION_CONFIG))
+    from_request = asyncio.run(collect_requests(config_request))
+    assert from_config == from_request
+    assert from_request[0] == config_request
+    assert [request.audio_content for request in from_request[1:]] == AUDIO_CHUNKS
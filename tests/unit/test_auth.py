@@ -1,9 +1,11 @@
 # SPDX-FileCopyrightText: Copyright (c) 2022 NVIDIA CORPORATION & AFFILIATES. All rights reserved.
 # SPDX-License-Identifier: MIT
 
+import asyncio
 from unittest.mock import Mock, patch
 
 import grpc
+import pytest
 
 from riva.client.auth import create_channel, Auth
 
@@ -24,3 +26,22 @@ class TestAuth:
         auth = Auth()
         metadata = auth.get_auth_metadata()
         assert metadata == []
+
+    def test_wait_for_channel_ready(self) -> None:
+        async def channel_ready() -> None:
+            pass
+
+        auth = Auth()
+        auth._channel = Mock(channel_ready=channel_ready)
+        auth._in_context = True
+        asyncio.run(auth.wait_for_channel_ready(timeout=1.0))
+
+    def test_wait_for_channel_ready_timeout(self) -> None:
+        async def channel_ready() -> None:
+            await asyncio.Event().wait()
+
+        auth = Auth()
+        auth._channel = Mock(channel_ready=channel_ready)
+        auth._in_context = True
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(auth.wait_for_channel_ready(timeout=0.01))